@@ -1,24 +1,175 @@
 from skimage import io
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.patches import Rectangle
+import functools
 import json
+from concurrent.futures import ThreadPoolExecutor
 from scipy.optimize import curve_fit
+from numba import njit, prange
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+def _decode_img(path):
+    # cv2 decodes considerably faster than the PIL-based skimage path
+    if cv2 is not None:
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is not None:
+            return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return io.imread(path)
+
+
+# images prefetched by KauDruck.preload_async, keyed by path
+_preload_futures = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _read_correction_table(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _load_correction_table(path):
+    # the raw text is cached across instances; parsing per call hands
+    # every caller a private dict, so nobody can poison the cache
+    return json.loads(_read_correction_table(path))
+
+
+@functools.lru_cache(maxsize=None)
+def _fit_force_correction(path, order=2):
+    data = _load_correction_table(path)
+    x = np.asarray(data['x_computed'], dtype=np.float32)
+    y = np.asarray(data['y_measured'], dtype=np.float32)
+    z = np.polyfit(x, y, order)
+    # plain float32 coefficient array (highest order first),
+    # evaluated through _eval_poly2; read-only because the lru_cache
+    # shares it across instances
+    coeffs = np.asarray(z, dtype=np.float32)
+    coeffs.setflags(write=False)
+    return coeffs
+
+
+def _model_func(x, a, b, c):
+    return a * np.exp(b * x) + c
+
+
+@functools.lru_cache(maxsize=None)
+def _fit_pixel_weight_correction(path):
+    data = _load_correction_table(path)
+    y = data['force_N']
+    x = data['pixelweight']
+    popt, _ = curve_fit(_model_func, x, y)
+    # float32 coefficients keep the pixelwise arrays in float32;
+    # read-only because the lru_cache shares it across instances
+    coeffs = np.asarray(popt, dtype=np.float32)
+    coeffs.setflags(write=False)
+    return coeffs
+
+
+@njit(fastmath=True, cache=True)
+def _eval_poly2(x, c):
+    # Horner evaluation of an order-2 polynomial, scalar or array x
+    return (c[0] * x + c[1]) * x + c[2]
+
+
+@njit(cache=True)
+def _compact_valid(force_img):
+    # split the NaN-marked force image into a dense 1-D array of the
+    # valid forces plus a 2-D validity mask
+    mask = np.empty(force_img.shape, np.bool_)
+    dense = np.empty(force_img.size, np.float32)
+    k = 0
+    for i in range(force_img.shape[0]):
+        for j in range(force_img.shape[1]):
+            v = force_img[i, j]
+            valid = not np.isnan(v)
+            mask[i, j] = valid
+            if valid:
+                dense[k] = v
+                k += 1
+    return dense[:k].copy(), mask
+
+
+@njit(cache=True)
+def _nan_stats(x):
+    # count, min, max and mean of the non-NaN entries in one pass
+    n = 0
+    s = 0.0
+    mn = np.inf
+    mx = -np.inf
+    for v in x.ravel():
+        if not np.isnan(v):
+            n += 1
+            s += v
+            if v < mn:
+                mn = v
+            if v > mx:
+                mx = v
+    if n == 0:
+        # degenerate like the all-NaN nanmax/nanmean path: report nan
+        # instead of dividing by zero
+        return 0, np.nan, np.nan, np.nan
+    return n, mn, mx, s / n
+
+
+def _build_force_lut(a, b, c, threshold, max_f):
+    # g + b takes at most 511 distinct values, so the whole
+    # intensity -> threshold -> exp model -> clamp chain collapses into
+    # one small table; invalid entries are marked NaN up front
+    inten = 1.0 - np.arange(511) * (0.5 / 255.0)
+    lut = (a * np.exp(b * inten) + c).astype(np.float32)
+    invalid = (inten < threshold) | (lut > max_f)
+    lut[invalid] = np.nan
+    return lut
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _pixelwise_kernel(img, lut):
+    # one gather from the L1-resident table per pixel
+    out = np.empty(img.shape[:2], np.float32)
+    for i in prange(img.shape[0]):
+        for j in range(img.shape[1]):
+            out[i, j] = lut[np.int64(img[i, j, 1]) + np.int64(img[i, j, 2])]
+    return out
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _reduce_aoi(img, threshold, scale):
+    # one pass over the AOI: intensity, threshold and both reductions fused
+    cnt = 0
+    wsum = 0.0
+    for i in prange(img.shape[0]):
+        for j in range(img.shape[1]):
+            inten = 1.0 - 0.5 * (scale * img[i, j, 1] + scale * img[i, j, 2])
+            if inten >= threshold:
+                cnt += 1
+                wsum += inten
+    return cnt, wsum
 
 class KauDruck():
     def __init__(self, image_path, aoi=None, aor=None, threshold=0.3):
         self.img = self.load_img(image_path)
-        self.force_correction_table_path = '../models/force_correction.json' 
-        self.force_correction_data = self._load_force_correction_table()
-        self.force_correction_model = self._fit_force_correction()
-        
-        self.pixel_weight_correction_table_path = '../models/pixelweight_correction.json' 
-        self.pixel_weight_correction_data = self._load_pixel_weight_correction_table()
-        self.pixel_weight_correction_model = self._fit_pixel_weight_correction()
+        self.force_correction_table_path = '../models/force_correction.json'
+        self.force_correction_data = _load_correction_table(self.force_correction_table_path)
+        self.force_correction_model = _fit_force_correction(self.force_correction_table_path)
+
+        self.pixel_weight_correction_table_path = '../models/pixelweight_correction.json'
+        self.pixel_weight_correction_data = _load_correction_table(self.pixel_weight_correction_table_path)
+        self.pixel_weight_correction_model = _fit_pixel_weight_correction(self.pixel_weight_correction_table_path)
         
         self.force_pixelwise = None
-        
-        self.img = self.img / 255   # scale image between 0 and 1
+        self._forces_valid = None
+        self._valid_mask = None
+
+        # keep the image as uint8; scaling to [0, 1] happens in the kernels
         self.area_corr_fact = 1.0021
+        # np.float64 so areas stay NumPy scalars (division by an empty
+        # region gives inf/nan instead of ZeroDivisionError)
+        self._px_to_mm2 = np.float64((25.4/800)**2 / self.area_corr_fact)
         self.force_aor = 50         # default value, in Newton
         if aoi is None:
             self.aoi = self.img
@@ -35,55 +186,63 @@ class KauDruck():
         self.threshold = threshold
         self.force_maximum_correction = None
         
-    def load_img(self, path_to_file):
-        img = io.imread(path_to_file)
-        return img
+    def load_img(self, path_to_file, region=None):
+        if region is not None:
+            # decode only the (x0, y0, x1, y1) window; for tiled formats
+            # PIL reads just the touched tiles instead of the full frame
+            from PIL import Image
+            with Image.open(path_to_file) as im:
+                img = np.asarray(im.crop(region))
+            return img
+        future = _preload_futures.pop(path_to_file, None)
+        if future is not None:
+            return future.result()
+        return _decode_img(path_to_file)
+
+    @staticmethod
+    def preload_async(paths, max_workers=None):
+        # decoding releases the GIL, so prefetching the next images
+        # overlaps their I/O with the analysis of the current one
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        for path in paths:
+            _preload_futures[path] = executor.submit(_decode_img, path)
+        executor.shutdown(wait=False)
     
     def set_maximum_force(self, maximum_force):
         self.force_maximum_correction = maximum_force
         
-    def _load_force_correction_table(self):
-        with open(self.force_correction_table_path) as f:
-            force_correction_data = json.load(f)
-        return force_correction_data
-    
-    def _fit_force_correction(self, order=2):
-        x = self.force_correction_data['x_computed']
-        y = self.force_correction_data['y_measured']
-        z = np.polyfit(x, y, order)
-        p = np.poly1d(z)
-        return p
-    
-    def _model_func(self, x, a, b, c):
-        return a * np.exp(b * x) + c
-    
-    def _load_pixel_weight_correction_table(self):
-        with open(self.pixel_weight_correction_table_path) as f:
-            pixel_weight_correction_data = json.load(f)
-        return pixel_weight_correction_data
-    
-    def _fit_pixel_weight_correction(self):
-        y = self.pixel_weight_correction_data['force_N']
-        x = self.pixel_weight_correction_data['pixelweight']
-        popt, _ = curve_fit(self._model_func, x, y)
-        return popt
-
     def compute_force_pixelwise(self,aoi=None):
         if aoi is None:
             aoi = self.aoi
-        intensity = self.compute_intensitat(aoi=aoi)
-        m = intensity < self.threshold
-        intensity[m] = np.nan
-        
-        
-        force_pixelwise = self._model_func(intensity, *self.pixel_weight_correction_model)
-        
-        if self.force_maximum_correction is not None:
-            with np.errstate(invalid='ignore'):
-                m = force_pixelwise > self.force_maximum_correction
-            force_pixelwise[m] = np.nan
-        
-        self.force_pixelwise = force_pixelwise
+
+        a, b, c = self.pixel_weight_correction_model
+        if self.force_maximum_correction is None:
+            max_f = np.inf
+        else:
+            max_f = self.force_maximum_correction
+
+        lut = _build_force_lut(a, b, c, self.threshold, max_f)
+        force_img = _pixelwise_kernel(aoi, lut)
+        # keep only the dense valid forces plus the validity mask; the
+        # NaN-marked 2-D image is rebuilt on demand by force_pixelwise
+        self._forces_valid, self._valid_mask = _compact_valid(force_img)
+        self._force_pixelwise = None
+
+    @property
+    def force_pixelwise(self):
+        if self._force_pixelwise is None and self._forces_valid is not None:
+            img = np.full(self._valid_mask.shape, np.nan, dtype=np.float32)
+            img[self._valid_mask] = self._forces_valid
+            self._force_pixelwise = img
+        return self._force_pixelwise
+
+    @force_pixelwise.setter
+    def force_pixelwise(self, value):
+        # any external assignment invalidates the dense cache;
+        # pixelwise_report rebuilds it lazily from the assigned image
+        self._force_pixelwise = value
+        self._forces_valid = None
+        self._valid_mask = None
     
     def compute_pressure_pixelwise(self):
         if self.force_pixelwise is None:
@@ -95,63 +254,64 @@ class KauDruck():
         
     def pixelwise_report(self):
         digit=2
+        # the dense array holds no NaNs, so the reductions skip all masking
+        if self._forces_valid is None:
+            self._forces_valid, self._valid_mask = _compact_valid(self.force_pixelwise)
+        forces = self._forces_valid
+        aoi_area_px, force_min, force_max, force_mean = _nan_stats(forces)
         print(f'Summary')
         print(f'------------------------------')
-        print(f'Maximum (N):        {np.round(np.nanmax(self.force_pixelwise),digit)}')
-        print(f'Minimum (N):        {np.round(np.nanmin(self.force_pixelwise),digit)}')
-        print(f'Mean (N):           {np.round(np.nanmean(self.force_pixelwise),digit)}')
-        print(f'Median (N):         {np.round(np.nanmedian(self.force_pixelwise),digit)}')
-        
-        aoi_area_px = np.sum(~np.isnan(self.force_pixelwise))
+        print(f'Maximum (N):        {np.round(force_max,digit)}')
+        print(f'Minimum (N):        {np.round(force_min,digit)}')
+        print(f'Mean (N):           {np.round(force_mean,digit)}')
+        force_median = float(np.median(forces)) if forces.size else float('nan')
+        print(f'Median (N):         {np.round(force_median,digit)}')
+
         aoi_area_mm2 = self.compute_area_mm(area_pixel=aoi_area_px)
         print(f'Area_mm2:           {np.round(aoi_area_mm2,digit)}')
-        
-        force = np.nanmean(self.force_pixelwise)
-        pressure = self.compute_pressure(force=force, area=aoi_area_mm2)
-        
+
+        if aoi_area_mm2:
+            pressure = self.compute_pressure(force=force_mean, area=aoi_area_mm2)
+        else:
+            pressure = float('nan')
+
         print(f'Pressure (MPa):     {np.round(pressure,digit)}')
         
     
     def crop_img(self, img, xy, height, width):
         img_cropped = img[xy[1]:xy[1]+height, xy[0]:xy[0]+width]
-        
-        bb_left = ((xy[0], xy[0]), (xy[1], xy[1]+height))
-        bb_upper = ((xy[0], xy[0]+width), (xy[1], xy[1]))
-        bb_right = ((xy[0]+width, xy[0]+width), (xy[1], xy[1]+height))
-        bb_lower = ( (xy[0], xy[0]+width), (xy[1]+height, xy[1]+height))
-        return img_cropped, (bb_left, bb_upper, bb_right, bb_lower)
-        
-    
+        # a contiguous crop gives the kernels unit inner stride
+        if not img_cropped.flags.c_contiguous:
+            img_cropped = np.ascontiguousarray(img_cropped)
+
+        bb = (xy[0], xy[1], width, height)
+        return img_cropped, bb
+
+
     def plot(self, ax=None, *args, **kwargs):
         if ax is None:
             fig, ax = plt.subplots()
         ax.imshow(self.img, *args, **kwargs)
-        
+
         if self.aoi is not None:
-            params={'color'     : 'green' , 
-                    'linewidth' : 2, 
-                    'linestyle' : 'solid'}
-            for i in range(len(self.aoi_bb)):
-                ax.plot(self.aoi_bb[i][0], 
-                         self.aoi_bb[i][1], 
-                         color=params['color'], 
-                         linewidth=params['linewidth'], 
-                         linestyle=params['linestyle'])
-        
+            x, y, width, height = self.aoi_bb
+            ax.add_patch(Rectangle((x, y), width, height,
+                                   fill=False,
+                                   edgecolor='green',
+                                   linewidth=2,
+                                   linestyle='solid'))
+
         if self.aor is not None:
-            params={'color'     : 'black' , 
-                    'linewidth' : 2, 
-                    'linestyle' : 'dashed'}         
-            for i in range(len(self.aor_bb)):
-                ax.plot(self.aor_bb[i][0],
-                         self.aor_bb[i][1], 
-                         color=params['color'], 
-                         linewidth=params['linewidth'], 
-                         linestyle=params['linestyle'])
+            x, y, width, height = self.aor_bb
+            ax.add_patch(Rectangle((x, y), width, height,
+                                   fill=False,
+                                   edgecolor='black',
+                                   linewidth=2,
+                                   linestyle='dashed'))
     
     def set_aoi(self, xy, height, width):
         self.aoi, self.aoi_bb = self.crop_img(self.img, xy, height, width)
-    
+
     def set_aor(self, xy, height, width):
         self.aor, self.aor_bb = self.crop_img(self.img, xy, height, width)
     
@@ -160,34 +320,35 @@ class KauDruck():
     
     
     def compute_results(self,aoi):
-        intensity = self.compute_intensitat(aoi)
-        m = intensity < self.threshold
-        intensity[m] = 0 
-        
-        flaeche = sum(sum(intensity > 0))
-        farbgewicht = sum(sum(intensity))
+        flaeche, farbgewicht = _reduce_aoi(aoi, self.threshold, 1.0 / 255.0)
+        # _reduce_aoi returns plain Python scalars; hand NumPy scalars
+        # downstream so divisions by an empty region keep the baseline
+        # nan/inf semantics instead of raising ZeroDivisionError
+        flaeche = np.int64(flaeche)
+        farbgewicht = np.float64(farbgewicht)
         quotient = farbgewicht / flaeche
-  
+
         return flaeche, farbgewicht, quotient
 
     def compute_kaudruck(self, weight_aoi, weight_aor, force_aor):
         return (weight_aoi / weight_aor) * force_aor
     
     def compute_intensitat(self, aoi):
-        green = aoi[:,:,1].copy()
-        blue = aoi[:,:,2].copy()
-        intensity = ( (1-green) + (1-blue) ) / 2
-        return intensity
+        # ((1-g) + (1-b)) / 2 == 1 - 0.5*(g+b), with the uint8 channels
+        # scaled to [0, 1] on the fly; summing the g/b slice directly
+        # gathers both neighbouring channels in one pass
+        gb = aoi[:, :, 1:3].sum(axis=2, dtype=np.float32)
+        return 1.0 - gb * np.float32(0.5 / 255.0)
     
     def set_area_corr_fact(self, corr_fact):
         self.area_corr_fact = corr_fact
+        self._px_to_mm2 = np.float64((25.4/800)**2 / self.area_corr_fact)
     
     def set_aor_force(self, force_N):
         self.force_aor = force_N
     
     def compute_area_mm(self, area_pixel):
-        area_mm = ((25.4/800)**2 * area_pixel) / self.area_corr_fact
-        return area_mm
+        return area_pixel * self._px_to_mm2
     
     def compute_pressure(self, force, area):
         return force / area
@@ -228,7 +389,8 @@ class KauDruck():
         self.aoi_pressure = self.compute_pressure(force=self.force_aoi, 
                                                    area=area_aoi_corrected)
         
-        self.force_aoi_corrected =  self.force_correction_model(self.force_aoi)
+        self.force_aoi_corrected = _eval_poly2(self.force_aoi,
+                                               self.force_correction_model)
         
         self.aoi_pressure_corrected = self.compute_pressure(force=self.force_aoi_corrected,
                                                             area=area_aoi_corrected)